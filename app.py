@@ -1,12 +1,44 @@
 import streamlit as st
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import sqlite3
+import csv
+import io
+import math
+import threading
+import atexit
 import time
 import os
-from datetime import datetime
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 import pytz
 
+# Charts are only rendered off-screen; the shared figures are reused, so the open-figure warning is off
+plt.rcParams["figure.max_open_warning"] = 0
+plt.rcParams["path.simplify_threshold"] = 1.0
+
+
+# Backend and font cache are initialised once per process instead of on the first chart a user opens
+@st.cache_resource
+def _warm_matplotlib():
+    fig, ax = plt.subplots()
+    ax.set_title("warm-up")
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+_warm_matplotlib()
+
+
+# Streamlit re-executes this file on every rerun, so locks shared between sessions must come from the resource cache
+@st.cache_resource
+def shared_lock(name, reentrant=False):
+    return threading.RLock() if reentrant else threading.Lock()
+
 # All Folders used in the program
 DATA_FOLDER = "user_data"
 REPORTS_FOLDER = "monthly_reports"
@@ -19,55 +51,147 @@ os.makedirs(RESET_FOLDER, exist_ok=True)
 os.makedirs(CHARTS_FOLDER, exist_ok=True)
 
 # Storing Usernames in the database
-conn = sqlite3.connect("user_data.db", check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    name TEXT PRIMARY KEY
-)
-""")
-conn.commit()
-
-
+# One shared connection across reruns (Streamlit reruns the script on every interaction)
+@st.cache_resource
+def get_conn():
+    c = sqlite3.connect("user_data.db", check_same_thread=False, isolation_level=None)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        name TEXT PRIMARY KEY
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS categories (
+        user TEXT,
+        category TEXT,
+        total REAL,
+        PRIMARY KEY (user, category)
+    )
+    """)
+    return c
+
+
+conn = get_conn()
+
+
+# Every session shares the connection, so reads and writes are serialised on _db_lock.
+# It is re-entrant so a read can hold it while seeding opens a transaction.
+_db_lock = shared_lock("db", reentrant=True)
+
+
+# The connection is in autocommit mode, so multi-row writes open their own transaction to commit once
+@contextmanager
+def transaction():
+    with _db_lock:
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+@st.cache_data(ttl=60)
 def get_all_users():
-    cursor.execute("SELECT name FROM users")
-    return [row[0] for row in cursor.fetchall()]
+    with _db_lock:
+        return [row[0] for row in conn.execute("SELECT name FROM users")]
 
 
 def add_user(name):
-    cursor.execute("INSERT OR IGNORE INTO users (name) VALUES (?)", (name,))
-    conn.commit()
+    with _db_lock:
+        conn.execute("INSERT OR IGNORE INTO users (name) VALUES (?)", (name,))
+    get_all_users.clear()
+
+
+# Each user's category totals live in the categories table
+DEFAULT_CATEGORIES = ["Food", "Travel", "Loans", "Entertainment", "Shopping", "Others", "Budget"]
 
 
-# Creating/Saving each user's csv file
+# Old per-user csv files, only read once to migrate them into the database
 def user_csv_path(name):
     return os.path.join(DATA_FOLDER, f"{name}.csv")
 
 
-def load_user_data(name):
+# Matches the old to_numeric(errors="coerce").fillna(0.0): anything that isn't a finite number counts as 0
+def parse_total(text):
+    try:
+        total = float(text)
+    except (TypeError, ValueError):
+        return 0.0
+    return total if math.isfinite(total) else 0.0
+
+
+def seed_user_data(name):
     file_path = user_csv_path(name)
     if os.path.exists(file_path):
-        df = pd.read_csv(file_path, encoding="utf-8")
-        # Ensure totals numeric
-        if "Total" in df.columns:
-            df["Total"] = pd.to_numeric(df["Total"], errors="coerce").fillna(0.0)
-        return df
+        # Two plain columns, so the csv module is enough
+        with open(file_path, "r", encoding="utf-8", newline="") as f:
+            rows = [(name, row["Categories"], parse_total(row["Total"])) for row in csv.DictReader(f)]
     else:
-        return pd.DataFrame({
-            "Categories": ["Food", "Travel", "Loans", "Entertainment", "Shopping", "Others", "Budget"],
-            "Total": [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-        })
+        rows = [(name, cat, 0.0) for cat in DEFAULT_CATEGORIES]
+    with transaction():
+        conn.executemany("INSERT OR IGNORE INTO categories (user, category, total) VALUES (?, ?, ?)", rows)
 
 
-def save_user_data(name, df):
-    file_path = user_csv_path(name)
-    df.to_csv(file_path, index=False, encoding="utf-8")
+# A user's totals kept as a plain dict; a DataFrame is only built when it is displayed
+@dataclass
+class UserState:
+    totals: dict
+
+    @property
+    def budget(self):
+        return self.totals["Budget"]
+
+    def expenses(self):
+        return {cat: tot for cat, tot in self.totals.items() if cat != "Budget"}
+
+    def to_frame(self):
+        return pd.DataFrame({"Categories": list(self.totals), "Total": list(self.totals.values())})
+
+
+def load_user_data(name):
+    query = "SELECT category, total FROM categories WHERE user=? ORDER BY rowid"
+    # Held across read-then-seed so no session sees another's half-seeded rows
+    with _db_lock:
+        totals = dict(conn.execute(query, (name,)))
+        if not totals:
+            seed_user_data(name)
+            totals = dict(conn.execute(query, (name,)))
+    return UserState(totals)
+
+
+# Hand-formatted csv export; the table is small and fixed-shape so to_csv's quoting engine isn't needed
+def user_data_csv(state):
+    lines = [f"{cat},{tot:.2f}\n" for cat, tot in state.totals.items()]
+    return "Categories,Total\n" + "".join(lines)
+
+
+def add_expense_db(name, category, amount):
+    with _db_lock:
+        conn.execute("UPDATE categories SET total=total+? WHERE user=? AND category=?",
+                     (float(amount), name, category))
+
+
+def set_budget_db(name, budget_val):
+    with _db_lock:
+        conn.execute("UPDATE categories SET total=? WHERE user=? AND category='Budget'", (float(budget_val), name))
+
+
+def reset_expenses_db(name):
+    with _db_lock:
+        conn.execute("UPDATE categories SET total=0 WHERE user=? AND category<>'Budget'", (name,))
 
 
 # Reports and charts defining for each user
+_TZ = pytz.timezone("Asia/Kolkata")
+
+
 def current_india_dt():
-    tz = pytz.timezone("Asia/Kolkata")
-    return datetime.now(tz)
+    return datetime.now(_TZ)
 
 
 def month_key(dt=None):
@@ -82,8 +206,30 @@ def month_label(dt=None):
     return dt.strftime("%B_%Y")  # e.g. "November_2025"
 
 
+def reports_folder_for(name):
+    folder = os.path.join(REPORTS_FOLDER, name)
+    key = f"reports_dir_{name}"
+    if st.session_state.get(key):
+        return folder
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+        # Move reports saved before the per-user folders existed
+        legacy = re.compile(rf"{re.escape(name)}_[A-Za-z]+_\d{{4}}\.txt")
+        with os.scandir(REPORTS_FOLDER) as it:
+            for entry in it:
+                if entry.is_file() and legacy.fullmatch(entry.name):
+                    os.replace(entry.path, os.path.join(folder, entry.name))
+    st.session_state[key] = True
+    return folder
+
+
 def report_file_path(name, dt=None):
-    return os.path.join(REPORTS_FOLDER, f"{name}_{month_label(dt)}.txt")
+    return os.path.join(reports_folder_for(name), f"{name}_{month_label(dt)}.txt")
+
+
+def list_reports(name):
+    with os.scandir(reports_folder_for(name)) as it:
+        return sorted((entry.name for entry in it if entry.is_file()), reverse=True)
 
 
 def reset_file_path(name):
@@ -92,32 +238,34 @@ def reset_file_path(name):
 
 def charts_folder_for(name):
     folder = os.path.join(CHARTS_FOLDER, name)
-    os.makedirs(folder, exist_ok=True)
+    key = f"charts_dir_{name}"
+    if not st.session_state.get(key):
+        os.makedirs(folder, exist_ok=True)
+        st.session_state[key] = True
     return folder
 
 
-def pie_chart_path(name, dt=None):
-    return os.path.join(charts_folder_for(name), f"{name}_{month_key(dt)}_pie.png")
+def pie_chart_path(name, dt=None, ext="svg"):
+    return os.path.join(charts_folder_for(name), f"{name}_{month_key(dt)}_pie.{ext}")
 
 
-def bar_chart_path(name, dt=None):
-    return os.path.join(charts_folder_for(name), f"{name}_{month_key(dt)}_bar.png")
+def bar_chart_path(name, dt=None, ext="svg"):
+    return os.path.join(charts_folder_for(name), f"{name}_{month_key(dt)}_bar.{ext}")
 
 
 # Computing Budget and alerts
 
-def compute_budget_status(df):
+def compute_budget_status(state):
     # Sum all categories except Budget
-    exp_df = df[df["Categories"] != "Budget"]
-    total_expenses = exp_df["Total"].sum()
-    budget_val = float(df.loc[df["Categories"] == "Budget", "Total"].values[0])
+    budget_val = state.budget
+    total_expenses = sum(state.totals.values()) - budget_val
     remaining = budget_val - total_expenses
     percent_used = (total_expenses / budget_val * 100) if budget_val > 0 else 0.0
     return budget_val, total_expenses, remaining, percent_used
 
 
-def show_budget_summary(df):
-    budget_val, total_expenses, remaining, percent_used = compute_budget_status(df)
+def show_budget_summary(state):
+    budget_val, total_expenses, remaining, percent_used = compute_budget_status(state)
     st.write(f"💵 Budget: ₹{budget_val:.2f}")
     st.write(f"💸 Spent: ₹{total_expenses:.2f}")
     st.write(f"✅ Remaining: ₹{remaining:.2f}")
@@ -135,141 +283,312 @@ def show_budget_summary(df):
 
 # Generating Charts and Saving Them
 
-def create_and_save_charts(name, df, dt=None):
-    exp_df = df[df["Categories"] != "Budget"].copy()
-    total = exp_df["Total"].sum()
+# Both figures are created once and redrawn in place; the lock keeps sessions from drawing on them at the same time
+@st.cache_resource
+def _figs():
+    return plt.subplots(figsize=(6, 4)), plt.subplots(figsize=(6, 4))
+
+
+_figs_lock = shared_lock("figs")
+
+# Charts are rendered as SVG; a PNG at this resolution is only rendered when asked for as a download
+DOWNLOAD_DPI = 150
+
+
+def chart_bytes_key(name, dt=None):
+    return f"chart_bytes_{name}_{month_key(dt)}"
+
+
+def render_charts(name, state, dt=None):
+    # Rendered SVGs are kept in the session and reused while the expense totals are unchanged
+    sig = tuple(state.expenses().items())
+    key = chart_bytes_key(name, dt)
+    cached = st.session_state.get(key)
+    if cached and cached[0] == sig:
+        return cached[1], cached[2]
+    with _figs_lock:
+        bar_bytes, pie_bytes = _draw_charts(state, "svg")
+    st.session_state[key] = (sig, bar_bytes, pie_bytes)
+    return bar_bytes, pie_bytes
+
+
+def render_png_charts(state):
+    with _figs_lock:
+        return _draw_charts(state, "png")
+
+
+def save_chart(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _fig_bytes(fig, fmt):
+    buf = io.BytesIO()
+    if fmt == "png":
+        fig.savefig(buf, format="png", dpi=DOWNLOAD_DPI, bbox_inches="tight")
+    else:
+        fig.savefig(buf, format=fmt)
+    return buf.getvalue()
+
+
+def _draw_charts(state, fmt):
+    expenses = state.expenses()
+    total = sum(expenses.values())
+    (fig_bar, ax_bar), (fig_pie, ax_pie) = _figs()
     # BAR CHART
-    fig_bar, ax_bar = plt.subplots(figsize=(6, 4))
+    ax_bar.clear()
     if total > 0:
-        ax_bar.bar(exp_df["Categories"], exp_df["Total"])
+        ax_bar.bar(list(expenses), list(expenses.values()))
         ax_bar.set_title("Expenses by Category")
         ax_bar.set_ylabel("Amount")
-        ax_bar.set_xticklabels(exp_df["Categories"], rotation=30, ha="right")
+        ax_bar.set_xticklabels(list(expenses), rotation=30, ha="right")
     else:
         ax_bar.text(0.5, 0.5, "No expense data yet", ha='center', va='center', fontsize=12)
         ax_bar.set_xticks([])
     fig_bar.tight_layout()
-    bar_path = bar_chart_path(name, dt)
-    fig_bar.savefig(bar_path, dpi=150, bbox_inches="tight")
-    plt.close(fig_bar)
+    bar_bytes = _fig_bytes(fig_bar, fmt)
 
     # PIE CHART
-    fig_pie, ax_pie = plt.subplots(figsize=(6, 4))
+    ax_pie.clear()
     if total > 0:
 
-        nonzero = exp_df[exp_df["Total"] > 0]
-        if nonzero.empty:
+        nonzero = {cat: tot for cat, tot in expenses.items() if tot > 0}
+        if not nonzero:
             ax_pie.text(0.5, 0.5, "No non-zero categories", ha='center', va='center')
         else:
-            ax_pie.pie(nonzero["Total"], labels=nonzero["Categories"], autopct="%1.1f%%")
+            ax_pie.pie(list(nonzero.values()), labels=list(nonzero), autopct="%1.1f%%")
             ax_pie.set_title("Expense Distribution")
     else:
         ax_pie.text(0.5, 0.5, "No expense data yet", ha='center', va='center', fontsize=12)
-    pie_path = pie_chart_path(name, dt)
-    fig_pie.savefig(pie_path, dpi=150, bbox_inches="tight")
-    plt.close(fig_pie)
+    pie_bytes = _fig_bytes(fig_pie, fmt)
 
-    return bar_path, pie_path
+    return bar_bytes, pie_bytes
 
 
 # Monthly Reports
+# Budget line is fixed width so a budget change can overwrite it in place
+def budget_line(budget_val):
+    return f"Budget: ₹{budget_val:>15.2f}\n"
+
+
+def report_header(name, dt, budget_val):
+    return (f"Expense Report for {name} - {dt.strftime('%B %Y')}\n"
+            + budget_line(budget_val)
+            + "Timestamp | Category | Amount\n")
+
+
+def update_report_budget(rpt, name, dt, budget_val):
+    new_line = budget_line(budget_val).encode("utf-8")
+    # Buffered expense lines must reach the file before it is edited, and no session may append meanwhile
+    with _report_lock:
+        _close_report_handle(rpt)
+        with open(rpt, "r+b") as f:
+            f.readline()
+            offset = f.tell()
+            old_line = f.readline()
+            f.seek(offset)
+            if not old_line.startswith("Budget:".encode("utf-8")):
+                # Expenses were logged while no budget was set, so the report has no header yet
+                f.seek(0)
+                rest = f.read()
+                f.seek(0)
+                f.write(report_header(name, dt, budget_val).encode("utf-8") + rest)
+            elif len(old_line) == len(new_line):
+                f.write(new_line)
+            else:
+                # Reports written before the fixed-width line need the rest shifted once
+                f.seek(offset + len(old_line))
+                rest = f.read()
+                f.seek(offset)
+                f.write(new_line + rest)
+                f.truncate()
+
+
 def ensure_monthly_report_exists(name, dt=None):
     dt = dt or current_india_dt()
     rpt = report_file_path(name, dt)
+    # Once the report is known to exist this session, skip the filesystem check
+    key = f"rpt_ready_{name}_{month_key(dt)}"
+    if st.session_state.get(key):
+        return rpt
     if not os.path.exists(rpt):
 
-        df = load_user_data(name)
-        budget_val = float(df.loc[df["Categories"] == "Budget", "Total"].values[0])
+        budget_val = load_user_data(name).budget
         if budget_val > 0:
             with open(rpt, "w", encoding="utf-8") as f:
-                f.write(f"Expense Report for {name} - {dt.strftime('%B %Y')}\n")
-                f.write(f"Budget: ₹{budget_val:.2f}\n")
-                f.write("Timestamp | Category | Amount\n")
+                f.write(report_header(name, dt, budget_val))
+            st.session_state[key] = True
+    else:
+        st.session_state[key] = True
     return rpt
 
 
+# Expense lines go through one buffered handle per report, flushed every REPORT_FLUSH_EVERY appends
+REPORT_FLUSH_EVERY = 16
+
+
+def _close_handles(handles):
+    for handle, _ in handles.values():
+        handle.close()
+    handles.clear()
+
+
+# Open handles are shared by every session; all access goes through _report_lock
+@st.cache_resource
+def _report_handles():
+    handles = {}
+    # Whatever is still buffered reaches disk when the server shuts down
+    atexit.register(_close_handles, handles)
+    return handles
+
+
+_report_lock = shared_lock("reports")
+
+
+def _report_handle(rpt):
+    # Caller holds _report_lock; entries are [handle, appends since last flush]
+    entry = _report_handles().get(rpt)
+    if entry is None:
+        entry = _report_handles()[rpt] = [open(rpt, "a", encoding="utf-8", buffering=64 * 1024), 0]
+    return entry
+
+
+def _close_report_handle(rpt):
+    # Caller holds _report_lock
+    entry = _report_handles().pop(rpt, None)
+    if entry is not None:
+        entry[0].close()
+
+
+def _user_report_paths(name):
+    # Caller holds _report_lock
+    folder = reports_folder_for(name)
+    return [rpt for rpt in _report_handles() if os.path.dirname(rpt) == folder]
+
+
+def flush_reports(name):
+    with _report_lock:
+        for rpt in _user_report_paths(name):
+            entry = _report_handles()[rpt]
+            entry[0].flush()
+            entry[1] = 0
+
+
+def close_stale_reports(name, current_rpt):
+    # Handles from earlier months are never appended to again
+    with _report_lock:
+        for rpt in _user_report_paths(name):
+            if rpt != current_rpt:
+                _close_report_handle(rpt)
+
+
 def append_expense_to_report(name, category, amount, dt=None):
     dt = dt or current_india_dt()
     rpt = report_file_path(name, dt)
 
     ensure_monthly_report_exists(name, dt)
     timestamp = dt.strftime("%d-%m-%Y %H:%M")
-    with open(rpt, "a", encoding="utf-8") as f:
-        f.write(f"{timestamp} | {category} | ₹{amount}\n")
+    with _report_lock:
+        entry = _report_handle(rpt)
+        entry[0].write(f"{timestamp} | {category} | ₹{amount}\n")
+        entry[1] += 1
+        if entry[1] >= REPORT_FLUSH_EVERY:
+            entry[0].flush()
+            entry[1] = 0
 
 
-def finalize_month_report(name, df, dt=None):
+def finalize_month_report(name, state, dt=None):
     dt = dt or current_india_dt()
     rpt = report_file_path(name, dt)
 
-    budget_val, total_expenses, remaining, percent_used = compute_budget_status(df)
-    with open(rpt, "a", encoding="utf-8") as f:
-        f.write("\n---- Month End Summary ----\n")
-        f.write(f"Total Expenses: ₹{total_expenses:.2f}\n")
-        f.write(f"Remaining: ₹{remaining:.2f}\n")
-        f.write(f"Percent Used: {percent_used:.2f}%\n")
-        if percent_used >= 100:
-            f.write("Status: Budget Exceeded\n")
-        elif percent_used >= 80:
-            f.write("Status: Close to Budget\n")
-        else:
-            f.write("Status: Within Budget\n")
-        f.write(f"Closed on: {dt.strftime('%d-%m-%Y')}\n")
-
-
-# Main StreamLit User interface
-st.set_page_config(page_title="Expense Tracker", layout="centered")
-
-st.title("💰 Expense Tracker")
-
-name = st.text_input("Enter your name (lowercase recommended):").strip().lower()
+    budget_val, total_expenses, remaining, percent_used = compute_budget_status(state)
+    with _report_lock:
+        _close_report_handle(rpt)
+        with open(rpt, "a", encoding="utf-8") as f:
+            f.write("\n---- Month End Summary ----\n")
+            f.write(f"Total Expenses: ₹{total_expenses:.2f}\n")
+            f.write(f"Remaining: ₹{remaining:.2f}\n")
+            f.write(f"Percent Used: {percent_used:.2f}%\n")
+            if percent_used >= 100:
+                f.write("Status: Budget Exceeded\n")
+            elif percent_used >= 80:
+                f.write("Status: Close to Budget\n")
+            else:
+                f.write("Status: Within Budget\n")
+            f.write(f"Closed on: {dt.strftime('%d-%m-%Y')}\n")
 
-if name:
 
-    all_users = get_all_users()
+# Per-user session bootstrap
+def bootstrap_user(name, india_dt):
     is_new_user = False
-    if name not in all_users:
+    if name not in get_all_users():
         add_user(name)
         is_new_user = True
 
-    df = load_user_data(name)
+    state = load_user_data(name)
 
     # Month Handling
-    india_dt = current_india_dt()
     current_mkey = month_key(india_dt)
+    rpt_path = report_file_path(name, india_dt)
+    close_stale_reports(name, rpt_path)
     reset_file = reset_file_path(name)
     last_saved_month = None
     if os.path.exists(reset_file):
         with open(reset_file, "r", encoding="utf-8") as f:
             last_saved_month = f.read().strip()
 
-    budget_val = float(df.loc[df["Categories"] == "Budget", "Total"].values[0])
-    if budget_val > 0:
+    if state.budget > 0:
         ensure_monthly_report_exists(name, india_dt)
     if last_saved_month != current_mkey and india_dt.day == 1:
         prev_month_dt = india_dt.replace(day=1)
-        from datetime import timedelta
-
         prev_last_day = prev_month_dt - timedelta(days=1)
-        finalize_month_report(name, df, prev_last_day)
+        finalize_month_report(name, state, prev_last_day)
 
-        df.loc[df["Categories"] != "Budget", "Total"] = 0.0
-        save_user_data(name, df)
+        for cat in state.expenses():
+            state.totals[cat] = 0.0
+        reset_expenses_db(name)
         with open(reset_file, "w", encoding="utf-8") as f:
             f.write(current_mkey)
         st.warning("📆 New month started: previous month's report finalized and expenses reset.")
 
+    return {
+        "state": state,
+        "mkey": current_mkey,
+        "rpt_path": rpt_path,
+        "chart_key": chart_bytes_key(name, india_dt),
+        "is_new_user": is_new_user,
+    }
+
+
+# Main StreamLit User interface
+st.set_page_config(page_title="Expense Tracker", layout="centered")
+
+st.title("💰 Expense Tracker")
+
+name = st.text_input("Enter your name (lowercase recommended):").strip().lower()
+
+if name:
+
+    # Per-user setup runs once per session and month; later reruns reuse the cached context
+    india_dt = current_india_dt()
+    ctx_key = f"user_{name}"
+    ctx = st.session_state.get(ctx_key)
+    if ctx is None or ctx["mkey"] != month_key(india_dt):
+        ctx = st.session_state[ctx_key] = bootstrap_user(name, india_dt)
+    state = ctx["state"]
+    rpt_path = ctx["rpt_path"]
+    chart_key = ctx["chart_key"]
+
     # UI for New users
-    if is_new_user and budget_val == 0.0:
+    if ctx["is_new_user"] and state.budget == 0.0:
         st.subheader(f"Welcome, {name} — set your monthly budget")
         new_budget = st.number_input("Set monthly budget (₹)", min_value=0.0, key=f"setbudget_{name}")
         if st.button("Save Budget", key=f"savebudget_{name}"):
-            df.loc[df["Categories"] == "Budget", "Total"] = float(new_budget)
-            save_user_data(name, df)
+            set_budget_db(name, new_budget)
             st.success("✅ Budget saved. You can now add expenses.")
 
             ensure_monthly_report_exists(name, india_dt)
-            create_and_save_charts(name, df, india_dt)
+            st.session_state.pop(ctx_key, None)
             st.experimental_rerun()
     # Ui for Exisitng Users
     else:
@@ -280,96 +599,96 @@ if name:
                                               "Generate/View Charts"])
 
         if menu == "View Summary":
-            show_budget_summary(df)
-            st.dataframe(df)
+            show_budget_summary(state)
+            st.dataframe(state.to_frame())
 
         elif menu == "Add Expense":
             st.write("Add an expense to a category:")
-            category = st.selectbox("Category", df[df["Categories"] != "Budget"]["Categories"].tolist(),
+            category = st.selectbox("Category", list(state.expenses()),
                                     key=f"cat_{name}")
             amount = st.number_input("Amount (₹)", min_value=0.0, key=f"amt_{name}")
             if st.button("Add Expense", key=f"add_{name}"):
 
-                df.loc[df["Categories"] == category, "Total"] += float(amount)
-                save_user_data(name, df)
+                add_expense_db(name, category, amount)
+                # Reload so totals written by other sessions are not shown stale
+                state = ctx["state"] = load_user_data(name)
+                st.session_state.pop(chart_key, None)
 
-                ensure_monthly_report_exists(name, india_dt)
                 append_expense_to_report(name, category, amount, india_dt)
 
-                create_and_save_charts(name, df, india_dt)
-
-                budget_val, total_exp, remaining, perc = compute_budget_status(df)
+                budget_val, total_exp, remaining, perc = compute_budget_status(state)
                 if perc >= 100:
                     st.error("🚨 ALERT: Budget exceeded!")
                 elif perc >= 80:
                     st.warning(f"⚠️ WARNING: Budget used {perc:.2f}%")
                 st.success(f"✅ Added ₹{amount} to {category}")
-                st.dataframe(df)
+                st.dataframe(state.to_frame())
 
         elif menu == "Modify Budget":
-            current_budget = float(df.loc[df["Categories"] == "Budget", "Total"].values[0])
+            current_budget = float(state.budget)
             new_budget_val = st.number_input("New budget (₹)", min_value=0.0, value=current_budget, key=f"mod_{name}")
             if st.button("Update Budget", key=f"update_{name}"):
-                df.loc[df["Categories"] == "Budget", "Total"] = float(new_budget_val)
-                save_user_data(name, df)
-
-                rpt = report_file_path(name, india_dt)
-                if os.path.exists(rpt):
-                    with open(rpt, "r", encoding="utf-8") as f:
-                        old = f.read()
-                    with open(rpt, "w", encoding="utf-8") as f:
-                        f.write(f"Expense Report for {name} - {india_dt.strftime('%B %Y')}\n")
-                        f.write(f"Budget: ₹{float(new_budget_val):.2f}\n")
-                        f.write(old.splitlines(True)[2] if len(old.splitlines(True)) > 2 else "")
+                set_budget_db(name, new_budget_val)
+                state = ctx["state"] = load_user_data(name)
+                st.session_state.pop(chart_key, None)
+
+                if os.path.exists(rpt_path):
+                    update_report_budget(rpt_path, name, india_dt, float(new_budget_val))
+                else:
+                    ensure_monthly_report_exists(name, india_dt)
                 st.success("✅ Budget updated")
 
-                create_and_save_charts(name, df, india_dt)
-
         elif menu == "Generate/View Reports":
 
-            ensure_monthly_report_exists(name, india_dt)
+            flush_reports(name)
 
-            files = sorted([f for f in os.listdir(REPORTS_FOLDER) if f.startswith(name)], reverse=True)
+            files = list_reports(name)
             if not files:
                 st.info("No reports yet.")
             else:
                 chosen = st.selectbox("Select report", files, key=f"reports_{name}")
                 if st.button("Open Report", key=f"openrep_{name}"):
-                    with open(os.path.join(REPORTS_FOLDER, chosen), "r", encoding="utf-8") as f:
+                    with open(os.path.join(reports_folder_for(name), chosen), "r", encoding="utf-8") as f:
                         content = f.read()
                     st.text_area("Report contents", content, height=400)
 
                 if st.button("Download Selected Report (txt)", key=f"dlrep_{name}"):
-                    with open(os.path.join(REPORTS_FOLDER, chosen), "r", encoding="utf-8") as f:
+                    with open(os.path.join(reports_folder_for(name), chosen), "r", encoding="utf-8") as f:
                         data = f.read()
                     st.download_button(f"Download {chosen}", data, file_name=chosen, mime="text/plain")
 
         elif menu == "Generate/View Charts":
 
-            create_and_save_charts(name, df, india_dt)
+            bar_bytes, pie_bytes = render_charts(name, state, india_dt)
             bar_path = bar_chart_path(name, india_dt)
             pie_path = pie_chart_path(name, india_dt)
-            st.write("Bar Chart (saved to project folder):")
-            if os.path.exists(bar_path):
-                st.image(bar_path, use_column_width=True)
-                with open(bar_path, "rb") as f:
-                    st.download_button("Download Bar Chart (PNG)", f, file_name=os.path.basename(bar_path),
-                                       mime="image/png")
-            else:
-                st.info("No bar chart found.")
-
-            st.write("Pie Chart (saved to project folder):")
-            if os.path.exists(pie_path):
-                st.image(pie_path, use_column_width=True)
-                with open(pie_path, "rb") as f:
-                    st.download_button("Download Pie Chart (PNG)", f, file_name=os.path.basename(pie_path),
-                                       mime="image/png")
-            else:
-                st.info("No pie chart found.")
+            # Charts are only saved to the project folder when downloaded
+            st.write("Bar Chart:")
+            st.image(bar_bytes.decode("utf-8"), width="stretch")
+            st.download_button("Download Bar Chart (SVG)", bar_bytes, file_name=os.path.basename(bar_path),
+                               mime="image/svg+xml", on_click=save_chart, args=(bar_path, bar_bytes))
+
+            st.write("Pie Chart:")
+            st.image(pie_bytes.decode("utf-8"), width="stretch")
+            st.download_button("Download Pie Chart (SVG)", pie_bytes, file_name=os.path.basename(pie_path),
+                               mime="image/svg+xml", on_click=save_chart, args=(pie_path, pie_bytes))
+
+            if st.button("Download Charts (PNG)", key=f"dlcharts_{name}"):
+                bar_png, pie_png = render_png_charts(state)
+                bar_png_path = bar_chart_path(name, india_dt, ext="png")
+                pie_png_path = pie_chart_path(name, india_dt, ext="png")
+                save_chart(bar_png_path, bar_png)
+                save_chart(pie_png_path, pie_png)
+                st.download_button("Download Bar Chart (PNG)", bar_png, file_name=os.path.basename(bar_png_path),
+                                   mime="image/png")
+                st.download_button("Download Pie Chart (PNG)", pie_png, file_name=os.path.basename(pie_png_path),
+                                   mime="image/png")
 
         st.markdown("---")
         if st.button("Show current data (table)"):
-            st.dataframe(df)
+            st.dataframe(state.to_frame())
         if st.button("Save data now"):
-            save_user_data(name, df)
-            st.success("Data saved.")
\ No newline at end of file
+            # Totals are written as each change is made; only buffered report lines are pending
+            flush_reports(name)
+            st.success("Data saved.")
+        st.download_button("Download data (CSV)", user_data_csv(state), file_name=f"{name}.csv", mime="text/csv")
\ No newline at end of file